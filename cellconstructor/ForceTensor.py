@@ -1130,7 +1130,7 @@ class Tensor3():
     def __init__(self, unitcell_structure=None, supercell_structure=None, supercell_size=None,dyn=None):
         #GenericTensor.__init__(self, *args, **kwargs)
         
-        if dyn != None:
+        if dyn is not None:
             unitcell_structure=dyn.structure
             supercell_size=dyn.GetSupercell()
             supercell_structure=dyn.structure.generate_supercell(supercell_size)
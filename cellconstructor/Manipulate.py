@@ -293,7 +293,7 @@ def generate_vibration_video(dynmat, filename, mode_id, amplitude, dt, N_t, supe
     
     # Extract the good one
     w = ws[mode_id]
-    _m_ = np.tile(superstruct.get_masses_array(), (3,1)).T.ravel()
+    _m_ = superstruct.get_masses_3n_array()
     polv = polvects[:, mode_id] / np.sqrt(_m_)
     polv /= np.linalg.norm(polv)
     
@@ -1570,7 +1570,7 @@ def GetIRSpectrum(dyn, w_array, smearing):
     g_propagator = dyn.get_phonon_propagator(w_array, smearing, only_gamma = True)
 
     # Get the masses
-    m = np.tile(dyn.structure.get_masses_array(), (3,1)).T.ravel()
+    m = dyn.structure.get_masses_3n_array()
 
     # Divide the propagator by the mass square root
     new_g = np.einsum("abw, a, b-> abw", g_propagator, 1 / np.sqrt(m), 1/np.sqrt(m))
@@ -1652,7 +1652,7 @@ def GetTwoPhononIRFromSecondOrderDypole(original_dyn, dM_dRdR, T, w_array, smear
     pol_vec = pol_vec[:, ~trans_mask]
 
     # Get an array of the masses for each 3nat_sc coordinate
-    m = np.tile(super_dyn.structure.get_masses_array(), (3,1)).T.ravel()
+    m = super_dyn.structure.get_masses_3n_array()
 
     # get e_mu/sqrt(m)
     enew = np.einsum("ab, a -> ba", pol_vec, 1/np.sqrt(m))
@@ -47,11 +47,16 @@ EV_TO_J = 1.602176634e-19
 AU = 1.66053906660e-27
 
 
-__all__ = ["covariant_coordinates", "from_dynmat_to_spectrum", 
-           "put_into_cell", "get_minimal_orthorombic_cell", 
-           "write_dynmat_in_qe_format", "get_gr", "cell2abc_alphabetagamma", 
+__all__ = ["covariant_coordinates", "from_dynmat_to_spectrum",
+           "put_into_cell", "get_minimal_orthorombic_cell",
+           "write_dynmat_in_qe_format", "get_gr", "cell2abc_alphabetagamma",
            "DistanceBetweenStructures"]
 
+# The last (basis, inverse metric tensor) pair used by covariant_coordinates.
+# Always rebound as a whole tuple, never mutated in place, so that
+# concurrent readers see a consistent pair.
+_metric_cache = None
+
 
 def covariant_coordinates(basis, vectors):
     """
@@ -84,17 +89,23 @@ def covariant_coordinates(basis, vectors):
             
     """
 
-    M, N = np.shape(basis)
-    
-    metric_tensor = np.zeros((N,N))
+    global _metric_cache
 
-    metric_tensor = basis.dot(basis.T)
-    # for i in range(0, N):
-    #     for j in range(i, N):
-    #         metric_tensor[i, j] = metric_tensor[j,i] = basis[i,:].dot(basis[j, :])
+    # Many callers invoke this function in a loop with the very same basis
+    # (e.g. once per atom): keep the last inverse metric tensor cached so
+    # that the inversion is performed only when the basis actually changes.
+    # Take a local reference first: the pair is published with a single
+    # assignment, so another thread can never see a basis matched with the
+    # inverse of a different one.
+    cached = _metric_cache
+    if cached is not None and np.array_equal(cached[0], basis):
+        imt = cached[1]
+    else:
+        metric_tensor = basis.dot(basis.T)
+
+        imt = np.linalg.inv(metric_tensor)
+        _metric_cache = (np.copy(basis), imt)
 
-    imt = np.linalg.inv(metric_tensor)
-    
     contra_vect = vectors.dot(basis.T)
     return contra_vect.dot(imt)
 
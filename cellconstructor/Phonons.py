@@ -11,6 +11,7 @@ from __future__ import division
 from cellconstructor import Settings
 
 import numpy as np
+import io
 import os, sys
 import scipy, scipy.optimize
 from scipy.stats import qmc
@@ -116,6 +117,11 @@ class Phonons:
         self.q_stars = []
         self.structure = None
 
+        # Memoized GetUpsilonMatrix and DyagDinQ results
+        # (see the respective methods)
+        self._upsilon_cache = {}
+        self._dyag_cache = {}
+
         dtype = np.complex128
         if force_real:
             dtype = np.float64
@@ -135,16 +141,34 @@ class Phonons:
             if nqirr <= 0:
                 raise ValueError("Error, nqirr argument must be a strictly positive number.")
 
-            self.dynmats = []
-            for i in range(nqirr):
-                # Create a dynamical matrix
-                self.dynmats.append(np.zeros((3 * structure.N_atoms, 3*structure.N_atoms), dtype = dtype))
+            # Create the dynamical matrices in a single allocation
+            # (one view per irreducible q point)
+            dyn_buffer = np.zeros((nqirr, 3 * structure.N_atoms, 3 * structure.N_atoms), dtype = dtype)
+            self.dynmats = [dyn_buffer[i] for i in range(nqirr)]
 
+            for i in range(nqirr):
                 # Initialize the q vectors
                 self.q_stars.append([np.zeros(3, dtype = np.float64)])
                 self.q_tot.append(np.zeros(3, dtype = np.float64))
 
 
+    def __getstate__(self):
+        # Do not pickle the memoization caches: they are heavy and their
+        # keys are built with hash(), which is not stable across processes
+        state = self.__dict__.copy()
+        state.pop("_dyag_cache", None)
+        state.pop("_upsilon_cache", None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
+        # Recreate the caches empty; this also covers objects pickled by
+        # versions that did not have them
+        self._dyag_cache = {}
+        self._upsilon_cache = {}
+
+
     def LoadFromQE(self, fildyn_prefix, nqirr=1, full_name = False, use_format= False, is_fulltext = False):
         r"""
         This Function loads the phonons information from the quantum espresso dynamical matrix.
@@ -200,9 +224,10 @@ class Phonons:
                     raise ValueError("Error, file %s does not exist." % filepath)
 
                 # Load the matrix as a regular file
-                dynfile = open(filepath, "r")
-                dynlines = [line.strip() for line in dynfile.readlines()]
-                dynfile.close()
+                # (iterate the file directly, readlines would materialize a
+                #  second copy of all the lines just to throw it away)
+                with open(filepath, "r") as dynfile:
+                    dynlines = [line.strip() for line in dynfile]
             else:
                 dynlines = [x.strip() for x in fildyn_prefix.split("\n")]
 
@@ -246,14 +271,17 @@ class Phonons:
                     dynlines.insert(3, "")
 
                 # Read the atomic type
+                # Each line is "<index> '<name> ' <mass>": split on the
+                # quotes only once and unpack both the name and the mass
                 atoms_dict = {}
                 masses_dict = {}
                 for atom_index in range(1, ntyp + 1):
-                    atm_line = dynlines[6 + atom_index]
-                    atoms_dict[atom_index] = atm_line.split("'")[1].strip()
+                    parts = dynlines[6 + atom_index].split("'")
+                    atm_name = parts[1].strip()
+                    atoms_dict[atom_index] = atm_name
 
                     # Get also the atomic mass
-                    masses_dict[atoms_dict[atom_index]] = np.float64(atm_line.split("'")[-1].strip())
+                    masses_dict[atm_name] = np.float64(parts[-1])
 
                 self.structure.set_masses(masses_dict)
 
@@ -271,19 +299,16 @@ class Phonons:
 
 
             # From now start reading the dynamical matrix -----------------------
-            reading_dyn = True
             q_star = []
 
-            # Pop the beginning of the matrix
-            while reading_dyn:
-                # Pop the file until you reach the dynamical matrix
-                if "cartesian axes" in dynlines[0]:
-                    reading_dyn = False
-                dynlines.pop(0)
+            # Skip the header advancing an integer cursor
+            # (popping the lines one by one from the list is O(N) per line)
+            index = 0
+            while "cartesian axes" not in dynlines[index]:
+                index += 1
 
             # Get the small q point
             reading_dyn = True
-            index = -1
             current_dyn = np.zeros((3*self.structure.N_atoms, 3*self.structure.N_atoms), dtype = np.complex128)
 
             # The atom indices
@@ -299,83 +324,115 @@ class Phonons:
             reading_eff_charges = False
             reading_raman = False
 
+            # The numeric body of the matrix is collected here and converted
+            # in a single shot when the matrix is complete, to keep the
+            # Python-level work per line at a minimum
+            dyn_buffer_lines = []
+            dyn_buffer_rows = []
+            dyn_buffer_cols = []
+
+            def flush_dyn_buffer():
+                # Convert all the collected numeric lines at once
+                # (interleaved real/imag columns) and scatter them into
+                # the current dynamical matrix
+                if not dyn_buffer_lines:
+                    return
+                data = np.fromstring(" ".join(dyn_buffer_lines), dtype = np.float64, sep = " ")
+                # The columns are interleaved (re, im) pairs: reinterpret the
+                # buffer as complex instead of building real + 1j*imag
+                data = data.view(np.complex128).reshape(-1, 3)
+                rows = np.array(dyn_buffer_rows, dtype = np.intp)
+                cols = np.array(dyn_buffer_cols, dtype = np.intp)
+                current_dyn[rows[:, None], cols[:, None] + np.arange(3)] = data
+                del dyn_buffer_lines[:]
+                del dyn_buffer_rows[:]
+                del dyn_buffer_cols[:]
+
             while reading_dyn:
                 # Advance in the reading
                 index += 1
 
                 if index >= len(dynlines):
                     reading_dyn = False
+                    flush_dyn_buffer()
                     self.dynmats.append(current_dyn.copy())
                     continue
 
                 # Setup what I'm reading
-                if "Diagonalizing" in dynlines[index]:
-                    reading_dyn = False
-                    self.dynmats.append(current_dyn.copy())
-
-                    continue
-                if "Dielectric" in dynlines[index]:
-                    reading_dielectric = True
-                    reading_eff_charges = False
-                    reading_raman = False
-
-                    # Reset the dielectric tensor
-                    self.dielectric_tensor = np.zeros((3,3))
-                    dielectric_read = 0
-
-                    continue
-                elif "Effective" in dynlines[index]:
-                    reading_dielectric = False
-                    reading_eff_charges = True
-                    reading_raman = False
-
-
-                    # Reset the effective charges
-                    self.effective_charges = np.zeros((self.structure.N_atoms, 3, 3))
-
-                    continue
-                elif  "Raman" in dynlines[index]:
-                    reading_dielectric = False
-                    reading_eff_charges = False
-                    reading_raman = True
+                # Almost every line in the file is numeric data: peek at the
+                # first character (data lines start with a digit, a minus or a
+                # dot) to skip the whole section-header scan on them
+                line = dynlines[index]
+                if len(line) > 0 and not (line[0].isdigit() or line[0] in "-."):
+                    if "Diagonalizing" in line:
+                        reading_dyn = False
+                        flush_dyn_buffer()
+                        self.dynmats.append(current_dyn.copy())
+
+                        continue
+                    if "Dielectric" in line:
+                        reading_dielectric = True
+                        reading_eff_charges = False
+                        reading_raman = False
+
+                        # Reset the dielectric tensor
+                        self.dielectric_tensor = np.zeros((3,3))
+                        dielectric_read = 0
 
-                    # Reset the raman tensor
-                    self.raman_tensor = np.zeros((3,3, 3*self.structure.N_atoms))
-                    continue
-                elif "q = " in dynlines[index]:
-                    #Read the q
-                    qpoint = np.array([float(item) for item in dynlines[index].replace("(", ")").split(')')[1].split()])
-                    q_star.append(qpoint / self.alat)
-                    self.q_tot.append(qpoint / self.alat)
-                    reading_dielectric = False
-                    reading_eff_charges = False
-                    reading_raman = False
-                    continue
-                elif "ynamical" in dynlines[index]:
-                    # Save the dynamical matrix
-                    self.dynmats.append(current_dyn.copy())
-                    reading_dielectric = False
-                    reading_eff_charges = False
-                    reading_raman = False
-                    continue
+                        continue
+                    elif "Effective" in line:
+                        reading_dielectric = False
+                        reading_eff_charges = True
+                        reading_raman = False
+
+
+                        # Reset the effective charges
+                        self.effective_charges = np.zeros((self.structure.N_atoms, 3, 3))
+
+                        continue
+                    elif  "Raman" in line:
+                        reading_dielectric = False
+                        reading_eff_charges = False
+                        reading_raman = True
+
+                        # Reset the raman tensor
+                        self.raman_tensor = np.zeros((3,3, 3*self.structure.N_atoms))
+                        continue
+                    elif "q = " in line:
+                        #Read the q
+                        qpoint = np.array([float(item) for item in line.replace("(", ")").split(')')[1].split()])
+                        q_star.append(qpoint / self.alat)
+                        self.q_tot.append(qpoint / self.alat)
+                        reading_dielectric = False
+                        reading_eff_charges = False
+                        reading_raman = False
+                        continue
+                    elif "ynamical" in line:
+                        # Save the dynamical matrix
+                        flush_dyn_buffer()
+                        self.dynmats.append(current_dyn.copy())
+                        reading_dielectric = False
+                        reading_eff_charges = False
+                        reading_raman = False
+                        continue
 
 
                 # Read what is needed
-                numbers_in_line = dynlines[index].split()
+                numbers_in_line = line.split()
                 if len(numbers_in_line) == 0:
                     continue
 
                 if reading_dielectric:
                     # Reading the dielectric
                     if len(numbers_in_line) == 3:
-                        self.dielectric_tensor[dielectric_read, :] = np.array([np.float64(x) for x in numbers_in_line])
+                        self.dielectric_tensor[dielectric_read, :] = np.fromstring(line, dtype = np.float64, sep = " ")
                         dielectric_read += 1
                 elif reading_eff_charges:
                     if numbers_in_line[0].lower() == "atom":
                         atm_i = int(numbers_in_line[2]) - 1
                         dielectric_read = 0
                     elif len(numbers_in_line) == 3:
-                        self.effective_charges[atm_i, dielectric_read,:] = np.array([np.float64(x) for x in numbers_in_line])
+                        self.effective_charges[atm_i, dielectric_read,:] = np.fromstring(line, dtype = np.float64, sep = " ")
                         dielectric_read += 1
                 elif reading_raman:
                     if numbers_in_line[0].lower() == "atom":
@@ -383,7 +440,7 @@ class Phonons:
                         pol_read = int(numbers_in_line[4]) - 1
                         dielectric_read = 0
                     elif len(numbers_in_line) == 3:
-                        self.raman_tensor[dielectric_read,:, 3*atm_i + pol_read] = np.array([np.float64(x) for x in numbers_in_line])
+                        self.raman_tensor[dielectric_read,:, 3*atm_i + pol_read] = np.fromstring(line, dtype = np.float64, sep = " ")
                         dielectric_read += 1
                 else:
                     # Read the numbers
@@ -394,8 +451,11 @@ class Phonons:
                         coordline = 0
                     elif(len(numbers_in_line) == 6):
                         # Read the dynmat
-                        for k in range(3):
-                            current_dyn[3 * atm_i + coordline, 3*atm_j + k] = np.float64(numbers_in_line[2*k]) + 1j*np.float64(numbers_in_line[2*k + 1])
+                        # Defer the conversion: just record the line and its
+                        # target position, flush_dyn_buffer does the rest
+                        dyn_buffer_rows.append(3 * atm_i + coordline)
+                        dyn_buffer_cols.append(3 * atm_j)
+                        dyn_buffer_lines.append(line)
                         coordline += 1
 
 
@@ -440,16 +500,21 @@ class Phonons:
 
 
 
-        # First of all get correct dynamical matrix by dividing per the masses.
-        real_dyn = np.zeros((3* self.structure.N_atoms, 3*self.structure.N_atoms), dtype = np.complex128)
-        for i, atm_type1 in enumerate(self.structure.atoms):
-            m1 = self.structure.masses[atm_type1]
-            for j, atm_type2 in enumerate(self.structure.atoms):
-                m2 = self.structure.masses[atm_type2]
-                real_dyn[3*i : 3*i + 3, 3*j : 3*j + 3] = 1 / np.sqrt(m1 * m2)
-
+        # Check if this very same problem has already been diagonalized.
+        # The result depends on the matrix, on the masses and on the q point
+        # (which selects the real-at-gamma branch), so fingerprint all of
+        # them; the hash is O(N^2), much cheaper than the O(N^3) eigh
+        masses = self.structure.get_masses_3n_array()
+        dyn_hash = hash(np.ascontiguousarray(self.dynmats[iq]).tobytes() +
+                        masses.tobytes() + self.q_tot[iq].tobytes())
+        cached = self._dyag_cache.get((iq, force_real_at_gamma))
+        if cached is not None and cached[0] == dyn_hash:
+            # Return copies, the callers are free to modify the results
+            return cached[1].copy(), cached[2].copy()
 
-        real_dyn *= self.dynmats[iq]
+        # First of all get correct dynamical matrix by dividing per the masses.
+        inv_sqrt_mass = 1 / np.sqrt(masses)
+        real_dyn = self.dynmats[iq] * np.outer(inv_sqrt_mass, inv_sqrt_mass)
 
         q_vec = self.q_tot[iq]
         if np.sqrt(q_vec.dot(q_vec)) < __EPSILON__:
@@ -486,6 +551,10 @@ class Phonons:
 
             pol_vects[:, i] /= norm
 
+        # Store the result (one entry per q index, replaced when the
+        # matrix changes)
+        self._dyag_cache[(iq, force_real_at_gamma)] = (dyn_hash, frequencies.copy(), pol_vects.copy())
+
         return frequencies, pol_vects
 
     def Copy(self):
@@ -502,14 +571,11 @@ class Phonons:
         ret.q_tot = [x.copy() for x in self.q_tot]
         ret.nqirr = self.nqirr
         ret.initialized = self.initialized
-        ret.q_stars = []
-        for qstar in self.q_stars:
-            ret.q_stars.append([x.copy() for x in qstar])
+        ret.q_stars = [[x.copy() for x in qstar] for qstar in self.q_stars]
 
         ret.alat = self.alat
 
-        for i, dyn in enumerate(self.dynmats):
-            ret.dynmats.append(dyn.copy())
+        ret.dynmats = [dyn.copy() for dyn in self.dynmats]
 
         if not self.effective_charges is None:
             ret.effective_charges = self.effective_charges.copy()
@@ -586,6 +652,21 @@ class Phonons:
 #        if self.nqirr != 1:
 #            raise ValueError("Error, this function yet not supports the supercells.")
 
+        # Memoize the result keyed on the temperature and a fingerprint of
+        # the dynamical matrices and of the masses (Upsilon is multiplied by
+        # sqrt(M_a M_b), and the masses can be changed through set_masses):
+        # hashing them is O(N^2), much cheaper than the O(N^3)
+        # diagonalization, and it safely detects in-place modifications.
+        # This makes repeated calls at the same temperature (e.g. the Monte
+        # Carlo loop of GetProbability) almost free.
+        cache_key = None
+        if w_pols is None:
+            fingerprint = tuple(hash(np.ascontiguousarray(dyn).tobytes()) for dyn in self.dynmats)
+            fingerprint += (hash(self.structure.get_masses_3n_array().tobytes()),)
+            cache_key = (np.float64(T), np.float64(min_w_threshold), fingerprint)
+            if cache_key in self._upsilon_cache:
+                return self._upsilon_cache[cache_key].copy()
+
         # We need frequencies and polarization vectors
         if w_pols is None:
             t1 = time.time()
@@ -631,7 +712,7 @@ class Phonons:
             nw = np.float64(0)
             #print "T = 0"
         else:
-            nw =  1. / (np.exp(w/(K_to_Ry * T)) -1)
+            nw =  1. / np.expm1(w/(K_to_Ry * T))
             #print "T > 0"
 
         # Compute the matrix
@@ -641,34 +722,35 @@ class Phonons:
         if verbose:
             print("[GET UPS] Time to prepare the upsilon computation: {} s".format(t1-t3))
 
-        pols_mod = np.einsum("ab,b -> ab", pols_conj, factor)
-        Upsilon = pols.dot(pols_mod.T)
+        # Scale the modes by the factor and contract with a BLAS matmul
+        Upsilon = (pols * factor).dot(pols_conj.T)
         t2 = time.time()
 
         if verbose:
             print("[GET UPS] Time to build the Upsilon matrix: {} s".format(t2 - t1))
 
         if debug:
-            Upsilon_old = np.einsum( "i, ji, ki", factor, pols, pols_conj, dtype = type_cal)
+            Upsilon_old = np.einsum( "i, ji, ki -> jk", factor, pols, pols_conj, dtype = type_cal)
             assert np.max(np.abs(Upsilon - Upsilon_old)) < 1e-10, "Error, the new Upsilon calculation is wrong"
         #_p1_, _p1vect_ = np.linalg.eigh(Upsilon)
         #np.savetxt("factor.dat", np.transpose([factor * RY_TO_CM / 2, _p1_[3:]* RY_TO_CM / 2]))
 
         # Get the masses for the final multiplication
+        # (broadcast the sqrt masses on rows and columns, no need to build
+        #  the big outer-product matrices explicitly)
         t1 = time.time()
-        mass_sqrt = np.sqrt(np.tile(super_struct.get_masses_array(), (3,1)).T.ravel())
-
-        #mass1 = np.zeros( 3*super_struct.N_atoms)
-        #for i in range(self.structure.N_atoms):
-        #    mass1[ 3*i : 3*i + 3] = np.sqrt(self.structure.masses[ super_struct.atoms[i]])
-
-        _m1_ = np.tile(mass_sqrt, (3 * super_struct.N_atoms, 1))
-        _m2_ = np.tile(mass_sqrt, (3 * super_struct.N_atoms, 1)).transpose()
+        mass_sqrt = np.sqrt(super_struct.get_masses_3n_array())
 
-        Upsilon *=  _m1_ * _m2_
+        Upsilon *= mass_sqrt[:, None]
+        Upsilon *= mass_sqrt[None, :]
         t2 = time.time()
         if verbose:
             print("[GET UPS] Time to multiply the masses: {} s".format(t2 -t1))
+
+        # Store a private copy in the cache (only the last result is kept)
+        if cache_key is not None:
+            self._upsilon_cache.clear()
+            self._upsilon_cache[cache_key] = Upsilon.copy()
         return Upsilon
 
     def GetProbability(self, displacement, T, upsilon_matrix = None, normalize = True, return_braket_vals = False):
@@ -729,8 +811,14 @@ class Phonons:
         # Compute the braket
         braket = np.einsum("i, ij, j", disp, upsilon_matrix, disp)
 
+        # If the normalization is not required the eigenvalues of the
+        # upsilon matrix are never used, skip the diagonalization at all
+        if not normalize and not return_braket_vals:
+            return np.exp(-braket)
+
         # Get the normalization
-        vals = np.linalg.eigvals(upsilon_matrix)
+        # (the upsilon matrix is symmetric, use the Hermitian eigensolver)
+        vals = np.linalg.eigvalsh(upsilon_matrix)
         vals = vals[np.argsort(np.abs(vals))]
 
         vals /= 2*np.pi
@@ -819,12 +907,8 @@ class Phonons:
         #print "TMASK:", tmask0, tmask1
 
 
-        _m1_ = np.zeros(self.structure.N_atoms * 3)
-        _m0_ = np.zeros(dyn0.structure.N_atoms * 3)
-
-        for i in range(self.structure.N_atoms):
-            _m1_[3*i : 3*i + 3] = self.structure.masses[self.structure.atoms[i]]
-            _m0_[3*i : 3*i + 3] = dyn0.structure.masses[dyn0.structure.atoms[i]]
+        _m1_ = self.structure.get_masses_3n_array()
+        _m0_ = dyn0.structure.get_masses_3n_array()
 
         # Get the q values
         q1 = np.real(np.einsum("i, ij, i", np.sqrt(_m1_), pols1, disp1.reshape(3 * self.structure.N_atoms)))
@@ -940,29 +1024,29 @@ class Phonons:
 
         n_modes = len(w)
 
-        # Strain the polarization vectors
-        new_vect = np.zeros(np.shape(pol_vects))
-        for i in range(3, n_modes):
-            for j in range(self.structure.N_atoms):
-                # Get the crystal representation of the polarization vector
-                cov_coord = Methods.covariant_coordinates(self.structure.unit_cell,
-                                                          pol_vects[3*j: 3*(j+1), i])
+        # Strain the polarization vectors.
+        # Get the crystal representation of all the atomic 3-vectors at once,
+        # then recast them in cartesian coordinates in the new cell
+        # (the translational modes in the first three columns are left to zero)
+        vecs = pol_vects[:, 3:].T.reshape(-1, 3)
+        cov_coords = Methods.covariant_coordinates(self.structure.unit_cell, vecs)
 
-                # Transform the crystal representation into the cartesian in the new cell
-                new_vect[3*j: 3*(j+1), i] = np.einsum("ij, i", new_cell, cov_coord)
+        new_vect = np.zeros(np.shape(pol_vects))
+        new_vect[:, 3:] = cov_coords.dot(new_cell).reshape(n_modes - 3, 3 * self.structure.N_atoms).T
 
         # Now prepare the new Covariance Matrix
         factor = np.zeros(n_modes)
         if T == 0:
             factor[3:] = 1 / (2. * w[3:])
         else:
-            n = 1 / (np.exp(w[3:] / (K_to_Ry * T)) - 1)
+            n = 1 / np.expm1(w[3:] / (K_to_Ry * T))
             factor[3:] = (1. + 2*n) / (2*w[3:])
 
-        cmat = np.einsum("i, hi,ki", factor, new_vect, new_vect)
+        cmat = (new_vect * factor).dot(new_vect.T)
 
         # Diagonalize once again
-        newf, new_pols = np.linalg.eig(cmat)
+        # (cmat is symmetric by construction, use the Hermitian eigensolver)
+        newf, new_pols = np.linalg.eigh(cmat)
 #
 #        # DEBUG PRINT
 #        prova1 = np.sort(newf)
@@ -971,10 +1055,8 @@ class Phonons:
 #            print "New: %e | Old: %e" % (prova1[i], prova2[i])
 #
 
-        # Sort the results
-        sort_mask = np.argsort(newf)
-        newf = newf[sort_mask]
-        new_pols = new_pols[:, sort_mask]
+        # No need to sort here, eigh already returns the eigenvalues
+        # in ascending order
 
         # Initialize the array of the new frequencies
         new_w = np.zeros(n_modes)
@@ -983,65 +1065,21 @@ class Phonons:
 
 
         # If the temperature is different from zero, we must obtain a new frequency
-        # using a numerical nonlinear solver
+        # using a numerical nonlinear solver.
+        # The equation 2 w newf = coth(w / 2kT) is independent for each mode,
+        # so the Newton iterations can be carried on the whole vector at once.
         if T != 0:
+            kT = K_to_Ry * T
+            f = newf[3:]
 
-            #def opt_func(w):
-            #    ret = 2*w*newf - 1./( 1 - np.exp(w / (K_to_Ry * T)))
-            #    if not np.shape(w):
-            #        if np.abs(w) < __EPSILON__:
-            #            return 0
-            #    else:
-            #        ret[np.abs(w) < __EPSILON__] = 0
-            #    return ret
-
-
-
-
-
-            #try:
-            #    for k in range(len(new_w)):
-            #       def new_func(x):
-            #            _x_ = np.ones(np.shape(newf)) * x
-            #            return opt_func(_x_)[k]
-            #        if np.abs(new_w[k]) < __EPSILON__:
-            #            continue
-            #        new_w[k] = scipy.optimize.anderson(new_func, new_w[k], verbose = True)
-
-      	    for k in range(3,36):
-                def g(w):
-                    f1= 2*w*newf[k]-1/np.tanh(w*0.5/(K_to_Ry*T))
-                    return f1
-
-                def g_prime(w):
-                    f2=2*newf[k]+0.5/(K_to_Ry*T*(np.sinh(w*0.5/(K_to_Ry*T)))**2)
-                    return f2
-
-                x_old=x_start
-                while True :
-                    x_new=x_old-g(x_old)/g_prime(x_old)
-                    if np.abs(g(x_new)) < threshold :
-                        break
-                    else:
-                        x_old=x_new
-                new_w[k]=x_new
-
-            #except ValueError:
-            #    print "Error, Nan encountered during the scipy minimization (T != 0)"
-            #    print "Starting w value:"
-            #    print new_w
-            #    print "new_f value:"
-            #    print newf
-            #    print "T:", T
-            #    raise ValueError("Aborting, error in scipy minimization.")
-
-
-
-                #
-                #        print "Compare frequencies:"
-#        for i in range(0,n_modes):
-#            print "New: %e | Old: %e" % (new_w[i], w[i])
-
+            x = np.ones(n_modes - 3) * x_start
+            while True:
+                g = 2*x*f - 1/np.tanh(x*0.5/kT)
+                if np.max(np.abs(g)) < threshold:
+                    break
+                g_prime = 2*f + 0.5/(kT*(np.sinh(x*0.5/kT))**2)
+                x -= g/g_prime
+            new_w[3:] = x
 
         # Sort once again
         sort_mask = np.argsort(new_w)
@@ -1052,17 +1090,15 @@ class Phonons:
         # Now we can rebuild the dynamical matrix
         out_dyn = self.Copy()
         out_dyn.structure.change_unit_cell(new_cell)
-        out_dyn.dynmats[0] = np.einsum("i, hi, ki", new_w**2, new_pols, new_pols)
+        out_dyn.dynmats[0] = (new_pols * new_w**2).dot(new_pols.T)
 
         # Get the masses for the final multiplication
-        mass1 = np.zeros( 3*self.structure.N_atoms)
-        for i in range(self.structure.N_atoms):
-            mass1[ 3*i : 3*i + 3] = self.structure.masses[ self.structure.atoms[i]]
+        # (broadcast the sqrt masses on rows and columns, no need to build
+        #  the big outer-product matrices explicitly)
+        mass_sqrt = np.sqrt(self.structure.get_masses_3n_array())
 
-        _m1_ = np.tile(mass1, (3 * self.structure.N_atoms, 1))
-        _m2_ = np.tile(mass1, (3 * self.structure.N_atoms, 1)).transpose()
-
-        out_dyn.dynmats[0] *= np.sqrt( _m1_ * _m2_ )
+        out_dyn.dynmats[0] *= mass_sqrt[:, None]
+        out_dyn.dynmats[0] *= mass_sqrt[None, :]
 
         return out_dyn
 
@@ -1103,83 +1139,95 @@ class Phonons:
         if full_name:
             nqirr = 1
 
-        # The following counter counts the total number of q points
-        count_q = 0
+        # Get the different number of types
+        types = []
+        n_atoms = self.structure.N_atoms
+        for i in range(n_atoms):
+            if not self.structure.atoms[i] in types:
+                types.append(self.structure.atoms[i])
+        n_types = len(types)
+
+        # Assign an integer for each atomic species
+        itau = {}
+        for i in range(n_types):
+            itau[types[i]] = i +1
+
+        # The header depends only on the structure: build it once and
+        # reuse it for every q point file
+        header = ["Dynamical matrix file\n"]
+
+        # Write the comment line
+        header.append("File generated with the CellConstructor by Lorenzo Monacelli\n")
+        header.append("%d %d %d %22.16f %22.16f %22.16f %22.16f %22.16f %22.16f\n" %
+                      (n_types, n_atoms, 0, self.alat * A_TO_BOHR, 0, 0, 0, 0, 0) )
+
+        # Write the basis vector
+        header.append("Basis vectors\n")
+        # Get the unit cell
+        for i in range(3):
+            header.append(" ".join("%22.16f" % x for x in self.structure.unit_cell[i,:] / self.alat) + "\n")
+
+        # Set the atom types and masses
+        for i in range(n_types):
+            header.append("\t%d  '%s '  %22.16f\n" % (i +1, types[i], self.structure.masses[types[i]]))
+
+        # Setup the atomic structure (index, species and coordinates in alat)
+        # formatted with a single np.savetxt call
+        itau_array = np.fromiter((itau[atm] for atm in self.structure.atoms),
+                                 dtype = np.float64, count = n_atoms)
+        coord_table = np.column_stack((np.arange(1, n_atoms + 1), itau_array,
+                                       self.structure.coords / self.alat))
+        coord_block = io.StringIO()
+        np.savetxt(coord_block, coord_table, fmt = "%5d %5d %22.16f %22.16f %22.16f")
+        header.append(coord_block.getvalue())
+        header = "".join(header)
+
+        # The index of the first q point of each star, so that every file
+        # is written independently from the previous ones
+        q_first_index = np.concatenate(([0], np.cumsum([len(x) for x in self.q_stars]))).astype(int)
+
         for iq in range(nqirr):
             # Prepare the file name appending the q point index
             fname = filename
             if not full_name:
                 fname += str(iq+1)
 
-            # Open the file
-            fp = open(fname, "w")
-            fp.write("Dynamical matrix file\n")
-
-            # Get the different number of types
-            types = []
-            n_atoms = self.structure.N_atoms
-            for i in range(n_atoms):
-                if not self.structure.atoms[i] in types:
-                    types.append(self.structure.atoms[i])
-            n_types = len(types)
-
-            # Assign an integer for each atomic species
-            itau = {}
-            for i in range(n_types):
-                itau[types[i]] = i +1
-
-            # Write the comment line
-            fp.write("File generated with the CellConstructor by Lorenzo Monacelli\n")
-            fp.write("%d %d %d %22.16f %22.16f %22.16f %22.16f %22.16f %22.16f\n" %
-                     (n_types, n_atoms, 0, self.alat * A_TO_BOHR, 0, 0, 0, 0, 0) )
-
-            # Write the basis vector
-            fp.write("Basis vectors\n")
-            # Get the unit cell
-            for i in range(3):
-                fp.write(" ".join("%22.16f" % x for x in self.structure.unit_cell[i,:] / self.alat) + "\n")
-
-            # Set the atom types and masses
-            for i in range(n_types):
-                fp.write("\t%d  '%s '  %22.16f\n" % (i +1, types[i], self.structure.masses[types[i]]))
-
-            # Setup the atomic structure
-            for i in range(n_atoms):
-                # Convert the coordinates in alat
-                coords = self.structure.coords[i,:] / self.alat
-                fp.write("%5d %5d %22.16f %22.16f %22.16f\n" %
-                         (i +1, itau[self.structure.atoms[i]],
-                          coords[0], coords[1], coords[2]))
+            # Open the file (with a large buffer, the matrix body is written
+            # in big chunks)
+            fp = open(fname, "w", buffering = 1 << 20)
+            fp.write(header)
 
             # Iterate over all the q points in the star
             nqstar = len(self.q_stars[iq])
             q_star = self.q_stars[iq] #* self.alat
 
-            # Store the first matrix index of the star
+            # The first matrix index of the star
             # This will be used to dyagonalize the matrix in the end of the file
+            count_q = q_first_index[iq]
             dyag_q_index = count_q
 
             for jq in range(nqstar):
                 # Here the dynamical matrix starts
-                fp.write("\n")
-                fp.write("     Dynamical Matrix in cartesian axes\n")
-                fp.write("\n")
-                fp.write("     q = ( %18.12f %18.12f %18.12f )\n" %
-                         (q_star[jq][0] * self.alat , q_star[jq][1]*self.alat, q_star[jq][2]*self.alat ))
-                fp.write("\n")
+                # Collect everything in a list and issue a single write per
+                # q point, instead of one call per line
+                parts = ["\n     Dynamical Matrix in cartesian axes\n\n"]
+                parts.append("     q = ( %18.12f %18.12f %18.12f )\n\n" %
+                             (q_star[jq][0] * self.alat , q_star[jq][1]*self.alat, q_star[jq][2]*self.alat ))
 
                 # Now print the dynamical matrix
+                # Interleave the real and imaginary parts of the whole matrix
+                # in one vectorized pass, so that each (i, j) block is a
+                # contiguous (3, 6) slice ready for the format string
+                dyn_inter = np.empty((3 * n_atoms, 6 * n_atoms))
+                dyn_inter[:, 0::2] = np.real(self.dynmats[count_q])
+                dyn_inter[:, 1::2] = np.imag(self.dynmats[count_q])
+                block_line = "%23.16f%23.16f   %23.16f%23.16f   %23.16f%23.16f\n"
+                block_fmt = "%5d%5d\n" + block_line * 3
                 for i in range(n_atoms):
                     for j in range(n_atoms):
-                        # Write the atoms
-                        fp.write("%5d%5d\n" % (i + 1, j + 1))
-                        for x in range(3):
-                            line = "%23.16f%23.16f   %23.16f%23.16f   %23.16f%23.16f" % \
-                                   ( np.real(self.dynmats[count_q][3*i + x, 3*j]), np.imag(self.dynmats[count_q][3*i + x, 3*j]),
-                                     np.real(self.dynmats[count_q][3*i + x, 3*j+1]), np.imag(self.dynmats[count_q][3*i+x, 3*j+1]),
-                                     np.real(self.dynmats[count_q][3*i + x, 3*j+2]), np.imag(self.dynmats[count_q][3*i+x, 3*j+2]) )
-
-                            fp.write(line +  "\n")
+                        block = dyn_inter[3*i : 3*i + 3, 6*j : 6*j + 6]
+                        parts.append(block_fmt % ((i + 1, j + 1) + tuple(block.ravel())))
+                fp.write("".join(parts))
 
                 # Go to the next q point
                 count_q += 1
@@ -1226,14 +1274,18 @@ class Phonons:
             freqs, pol_vects = self.DyagDinQ(dyag_q_index)
 
             # Compute the displacemets from the polarization vectors
-            _m_ = self.structure.get_masses_array()
-            _m_ = np.tile(_m_, (3,1)).T.ravel()
+            _m_ = self.structure.get_masses_3n_array()
 
             # Compute the atomic displacements
             atomic_disp = np.einsum("ab, a -> ab", pol_vects, 1 / np.sqrt(_m_) )
             # Normalize the displacements
             atomic_disp[:,:] /= np.tile( np.sqrt(np.sum(np.abs(atomic_disp)**2, axis = 0)), (self.structure.N_atoms * 3, 1))
 
+            # Take the real and imaginary parts once, instead of a np.real /
+            # np.imag call per scalar inside the loops below
+            disp_real = np.real(atomic_disp)
+            disp_imag = np.imag(atomic_disp)
+
             nmodes = len(freqs)
             for mu in range(nmodes):
                 # Print the frequency
@@ -1243,9 +1295,9 @@ class Phonons:
                 # Print the polarization vectors
                 for i in range(n_atoms):
                     fp.write("( %10.6f%10.6f %10.6f%10.6f %10.6f%10.6f )\n" %
-                             (np.real(atomic_disp[3*i, mu]), np.imag(atomic_disp[3*i,mu]),
-                              np.real(atomic_disp[3*i+1, mu]), np.imag(atomic_disp[3*i+1,mu]),
-                              np.real(atomic_disp[3*i+2, mu]), np.imag(atomic_disp[3*i+2,mu])))
+                             (disp_real[3*i, mu], disp_imag[3*i, mu],
+                              disp_real[3*i+1, mu], disp_imag[3*i+1, mu],
+                              disp_real[3*i+2, mu], disp_imag[3*i+2, mu]))
             fp.write("*" * 75 + "\n")
             fp.close()
 
@@ -1586,20 +1638,21 @@ class Phonons:
         In this way the dynamical matrix will be always positive definite.
         """
 
-        # Prepare the masses matrix
-        mass1 = np.zeros( 3*self.structure.N_atoms)
-        for i in range(self.structure.N_atoms):
-            mass1[ 3*i : 3*i + 3] = self.structure.masses[ self.structure.atoms[i]]
+        # Prepare the masses
+        sqrt_mass = np.sqrt(self.structure.get_masses_3n_array())
 
-        _m1_ = np.tile(mass1, (3 * self.structure.N_atoms, 1))
-        _m2_ = np.tile(mass1, (3 * self.structure.N_atoms, 1)).transpose()
+        # Diagonalize all the q points with one batched LAPACK call
+        dyn_stack = np.array(self.dynmats)
+        dyn_stack *= np.outer(1 / sqrt_mass, 1 / sqrt_mass)[None, :, :]
+        w2, pols = np.linalg.eigh(dyn_stack)
 
-        for iq in range(len(self.dynmats)):
-            # Diagonalize the matrix
-            w, pols = self.DyagDinQ(iq)
+        # Taking |w^2| is what makes the rebuilt matrix positive definite
+        new_dyns = np.einsum("qij, qj, qkj -> qik", pols, np.abs(w2), np.conj(pols))
+        new_dyns *= sqrt_mass[None, :, None]
+        new_dyns *= sqrt_mass[None, None, :]
 
-            matrix = np.einsum("i, ji, ki", w**2, pols, np.conj(pols)) * np.sqrt(_m1_ * _m2_)
-            self.dynmats[iq] = matrix
+        for iq in range(len(self.dynmats)):
+            self.dynmats[iq] = new_dyns[iq]
 
 
     def ForcePositiveDefinite_2(self):
@@ -1620,18 +1673,13 @@ class Phonons:
         In this way the dynamical matrix will be always positive definite.
         """
 
-        # Prepare the masses matrix
-        mass1 = np.zeros( 3*self.structure.N_atoms)
-        for i in range(self.structure.N_atoms):
-            mass1[ 3*i : 3*i + 3] = self.structure.masses[ self.structure.atoms[i]]
-
-        _m1_ = np.tile(mass1, (3 * self.structure.N_atoms, 1))
-        _m2_ = np.tile(mass1, (3 * self.structure.N_atoms, 1)).transpose()
-
+        # Prepare the masses
+        sqrt_mass = np.sqrt(self.structure.get_masses_3n_array())
 
         numq=len(self.dynmats)
-        w=np.zeros((numq,3*self.structure.N_atoms), dtype = np.float64)
-        pols=np.zeros((numq,3*self.structure.N_atoms,3*self.structure.N_atoms), dtype = np.complex128 )
+        # Use np.empty, the arrays are completely overwritten below
+        w=np.empty((numq,3*self.structure.N_atoms), dtype = np.float64)
+        pols=np.empty((numq,3*self.structure.N_atoms,3*self.structure.N_atoms), dtype = np.complex128 )
 
         for iq in range(numq):
             # Diagonalize the matrix
@@ -1646,7 +1694,9 @@ class Phonons:
         for iq in range(numq):
             v=pols[iq,:,:]
             fr=w[iq,:]
-            matrix = np.einsum("i, ji, ki", fr**2, v, np.conj(v)) * np.sqrt(_m1_ * _m2_)
+            matrix = (v * fr**2).dot(np.conj(v).T)
+            matrix *= sqrt_mass[:, None]
+            matrix *= sqrt_mass[None, :]
             self.dynmats[iq] = matrix
 
 
@@ -1691,23 +1741,23 @@ class Phonons:
         w, pol_vects = self.DyagDinQ(0)
 
         # Get the mass array
-        _m_ = np.zeros( 3*self.structure.N_atoms)
-        for i in range(self.structure.N_atoms):
-            _m_[ 3*i : 3*i + 3] = self.structure.masses[ self.structure.atoms[i]]
+        _m_ = self.structure.get_masses_3n_array()
 
         # Apply translation
         trans = Methods.get_translations(pol_vects, self.structure.get_masses_array())
         pol_vects[:, trans] = 0
 
-        # The super sum
-        #print np.shape(self.raman_tensor), np.shape(pol_vects), np.shape(_m_), np.shape(pol_in), np.shape(pol_out)
-        I = np.einsum("ijk, kl, k, i, j", self.raman_tensor, pol_vects, 1/np.sqrt(_m_), pol_in, pol_out)
+        # The super sum, contracted in two steps: first project the raman
+        # tensor on the light polarizations (a small (3N,) vector), then a
+        # single dot over the modes
+        proj = np.einsum("i, ijk, j -> k", pol_in, self.raman_tensor, pol_out)
+        I = (proj / np.sqrt(_m_)).dot(pol_vects)
 
         # Get the bosonic occupation number
         n = np.zeros(len(w))
         if T > 0:
             beta = 1 / (K_to_Ry*T)
-            n = 1 / (np.exp(beta * w) - 1.)
+            n = 1 / np.expm1(beta * w)
 
         return np.abs(I**2) * (1. + n) / w
 
@@ -2031,7 +2081,7 @@ class Phonons:
         nat = self.structure.N_atoms * np.prod(self.GetSupercell())
 
         # Check that the matrix is positive definite
-        if any([w < 0 for w in ws]):
+        if np.any(ws < 0):
             ERR_MSG = """
     Error, the current matrix is not positive definite.
            I cannot extract a random ensamble.
@@ -2061,10 +2111,12 @@ class Phonons:
             raise ValueError('sobol is not True or False') # This should never raise
 
         # Get the masses for the final multiplication
-        mass1 = np.tile(super_structure.get_masses_array(), (3, 1)).T.ravel()
+        mass1 = super_structure.get_masses_3n_array()
 
-        # TODO: I believe this is the heavy part of the extraction
-        total_coords = np.einsum("ij, i, j, kj->ik", pol_vects, 1/np.sqrt(mass1), a_mu, rand)
+        # Scale the polarization basis by the mode amplitudes and the masses,
+        # then generate all the displacements with a single matrix product
+        total_coords = (pol_vects * a_mu).dot(np.asarray(rand).T)
+        total_coords /= np.sqrt(mass1)[:, None]
 
 
 
@@ -2083,16 +2135,13 @@ class Phonons:
                 total_coords[:, confid] = new_coords
 
         # Prepare the structures
+        # Generate all the new atomic positions with a single broadcast sum
+        all_coords = super_structure.coords[None, :, :] + total_coords.T.reshape((size, -1, 3))
+
         final_structures = []
         for i in range(size):
             tmp_str = super_structure.copy()
-            # Prepare the new atomic positions
-
-
-            # TODO: THis is the heavy part, probably we can replace this for loop
-            tmp_str.coords[:,:] += total_coords[:,i].reshape((tmp_str.N_atoms, 3))
-            #for k in range(tmp_str.N_atoms):
-            #    tmp_str.coords[k,:] += total_coords[3*k : 3*(k+1), i]
+            tmp_str.coords = all_coords[i]
 
             # Check if you must to pop some atoms:
             if len (isolate_atoms):
@@ -2102,8 +2151,7 @@ class Phonons:
                 else:
                     tmp_str.N_atoms = len(isolate_atoms) * np.prod(self.GetSupercell())
                     new_coords = tmp_str.coords.copy()
-                    for j, x in enumerate(isolate_atoms):
-                        tmp_str.coords[j,:] = new_coords[x,:]
+                    tmp_str.coords[: len(isolate_atoms), :] = new_coords[isolate_atoms, :]
             final_structures.append(tmp_str)
 
 
@@ -2426,12 +2474,12 @@ class Phonons:
                 w_mu = _wmu_[mu]
                 n_mu = 0
                 if temperature > 0:
-                    n_mu = 1 / (np.exp(w_mu  / (temperature * K_to_Ry)) - 1)
+                    n_mu = 1 / np.expm1(w_mu  / (temperature * K_to_Ry))
                 for nu in range(3*nat):
                     w_nu = _wnu_[nu]
                     n_nu = 0
                     if temperature > 0:
-                        n_nu = 1 / (np.exp(w_nu  / (temperature * K_to_Ry)) - 1)
+                        n_nu = 1 / np.expm1(w_nu  / (temperature * K_to_Ry))
 
                     chi1 = 0
                     if not (exclude_acoustic and trans2[nu]):
@@ -2441,7 +2489,7 @@ class Phonons:
 
                     w_nu = _wnu2_[nu]
                     if temperature > 0:
-                        n_nu = 1 / (np.exp(w_nu  / (temperature * K_to_Ry)) - 1)
+                        n_nu = 1 / np.expm1(w_nu  / (temperature * K_to_Ry))
 
                     chi2 = 0
                     if not (exclude_acoustic and trans3[nu]):
@@ -2564,12 +2612,12 @@ class Phonons:
             n_mu = 0
             dn_dw = 0
             if T > __EPSILON__:
-                n_mu = 1 / (np.exp(w_mu  / (T * K_to_Ry)) - 1)
+                n_mu = 1 / np.expm1(w_mu  / (T * K_to_Ry))
                 dn_dw = -n_mu / (T * K_to_Ry * (1 - np.exp(-w_mu  / (T * K_to_Ry))))
             for nu, w_nu in enumerate(_w_):
                 n_nu = 0
                 if T > __EPSILON__:
-                    n_nu = 1 / (np.exp(w_nu  / (T * K_to_Ry)) - 1)
+                    n_nu = 1 / np.expm1(w_nu  / (T * K_to_Ry))
 
                 chi1 = np.zeros(np.shape(w), dtype = np.complex128)
                 chi2 = np.zeros(np.shape(w), dtype = np.complex128)
@@ -2684,7 +2732,7 @@ class Phonons:
             # Correctly account for not positive definite dynamical matrices
             w2 = w**2 * np.sign(w)
 
-            m = np.tile(super_structure.get_masses_array(), (3,1)).T.ravel()
+            m = super_structure.get_masses_3n_array()
             m_sqrt = np.sqrt(m)
 
             epols = np.einsum("ab, a -> ab", pols, m_sqrt)
@@ -2709,11 +2757,21 @@ class Phonons:
             if many_configs:
                 raise NotImplementedError("Error, use the use_unit_cell = True if you want to compute many configurations.")
 
+            # The real space force constants are real (any residual imaginary
+            # part is Fourier noise): work in real arithmetic, the matvec
+            # costs half with respect to the complex one
+            if np.iscomplexobj(real_space_fc):
+                real_space_fc = np.real(real_space_fc)
+
+            # The matrix-vector product gives both the energy and the forces,
+            # compute it only once
+            fv = real_space_fc.dot(rv)
+
             # Get the energy
-            energy = 0.5 * rv.dot ( np.real(real_space_fc)).dot(rv)
+            energy = 0.5 * rv.dot(fv)
 
             # Get the forces (Ry/ bohr)
-            forces = - real_space_fc.dot(rv)
+            forces = - fv
 
         nat_sc = self.structure.N_atoms * np.prod(supercell)
 
@@ -2773,7 +2831,8 @@ class Phonons:
         if nat_sc != super_structure.N_atoms:
             raise ValueError("Error, the super_structure number of atoms %d does not match %d computed from the q points." % (super_structure.N_atoms, nat_sc))
 
-        dynmat = np.zeros( (nq, 3*nat, 3*nat), dtype = np.complex128, order = "F")
+        # Use np.empty, the array is completely overwritten below
+        dynmat = np.empty( (nq, 3*nat, 3*nat), dtype = np.complex128, order = "F")
 
         # Fill the dynamical matrix
         for i, q in enumerate(self.q_tot):
@@ -3149,7 +3208,7 @@ WARNING: Effective charges are not accounted by this method
         Testing function, it applies symmetries in the supercell.
         """
 
-        if supercell_size == None:
+        if supercell_size is None:
             supercell_size = self.GetSupercell()
 
 
@@ -3615,7 +3674,7 @@ WARNING: Effective charges are not accounted by this method
                 else:
                     fc_gamma = t2.Interpolate(np.zeros(3), q_direct= -lo_to_split)
 
-                _m_ = np.tile(self.structure.get_masses_array(), (3,1)).T.ravel()
+                _m_ = self.structure.get_masses_3n_array()
                 d_gamma = fc_gamma / np.sqrt(np.outer(_m_, _m_))
                 wq2, eq = np.linalg.eigh(d_gamma)
 
@@ -3809,9 +3868,8 @@ WARNING: Effective charges are not accounted by this method
             raise IOError("Error, the given file {} does not exist".format(filename))
 
         # Read all the file
-        f = open(filename, "r")
-        lines = [l.strip() for l in f.readlines()]
-        f.close()
+        with open(filename, "r") as f:
+            lines = [l.strip() for l in f]
 
         # The triggers to know what I am reading
         reading_dielectric = False
@@ -4430,7 +4488,7 @@ def get_dyn_from_ase_phonons(ase_ph, adjust_qstar = True):
 
             i_block = Methods.identify_vector(supercell_structure.unit_cell, R_cN, delta_R)
 
-            if i_block == None:
+            if i_block is None:
                 ERR_MSG="""
 ERROR, the ASE Phonons seems not to contain a supercell vector needed for the
        force constant matrix:
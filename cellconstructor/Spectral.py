@@ -72,7 +72,7 @@ def get_static_bubble(tensor2, tensor3, k_grid, q, T , verbose = False):
 
 
     # dynamical matrix in q
-    m = np.tile(structure.get_masses_array(), (3,1)).T.ravel()
+    m = structure.get_masses_3n_array()
     mm_mat = np.sqrt(np.outer(m, m))
     mm_inv_mat = 1 / mm_mat
     #
@@ -334,20 +334,20 @@ def get_static_correction_along_path(dyn,
     print(" k grid= {} x {} x {} ".format(*tuple(k_grid)))
     print(" ")
 
-    if ( tensor2 == None ):
+    if ( tensor2 is None ):
         # Prepare the tensor2
         tensor2 = CC.ForceTensor.Tensor2(dyn.structure, dyn.structure.generate_supercell(dyn.GetSupercell()), dyn.GetSupercell())
         tensor2.SetupFromPhonons(dyn)
         tensor2.Center()
 
     # Scale the FC3 ===========================================================================
-    if  d3_scale_factor != None :
+    if  d3_scale_factor is not None :
             print(" ")
             print(" d3 scaling : d3 -> d3 x {:>7.3f}".format(d3_scale_factor))
             print(" ")
             tensor3.tensor=tensor3.tensor*d3_scale_factor
     #  ================================== q-PATH ===============================================
-    if  q_path_file == None:
+    if  q_path_file is None:
         q_path=np.array(q_path)
     else:
         print(" ")
@@ -372,7 +372,7 @@ def get_static_correction_along_path(dyn,
     # ==========================================================================================
 
     # Mass matrix
-    m = np.tile(dyn.structure.get_masses_array(), (3,1)).T.ravel()
+    m = dyn.structure.get_masses_3n_array()
     mm_mat = np.sqrt(np.outer(m, m))
 
     # Allocate frequencies array
@@ -500,20 +500,20 @@ def get_static_correction_along_path_multiprocessing(dyn,
     print(" k grid= {} x {} x {} ".format(*tuple(k_grid)))
     print(" ")
 
-    if ( tensor2 == None ):
+    if ( tensor2 is None ):
         # Prepare the tensor2
         tensor2 = CC.ForceTensor.Tensor2(dyn.structure, dyn.structure.generate_supercell(dyn.GetSupercell()), dyn.GetSupercell())
         tensor2.SetupFromPhonons(dyn)
         tensor2.Center()
 
     # Scale the FC3 ===========================================================================
-    if  d3_scale_factor != None :
+    if  d3_scale_factor is not None :
             print(" ")
             print(" d3 scaling : d3 -> d3 x {:>7.3f}".format(d3_scale_factor))
             print(" ")
             tensor3.tensor=tensor3.tensor*d3_scale_factor
     #  ================================== q-PATH ===============================================
-    if  q_path_file == None:
+    if  q_path_file is None:
         q_path=np.array(q_path)
     else:
         print(" ")
@@ -538,7 +538,7 @@ def get_static_correction_along_path_multiprocessing(dyn,
     # ==========================================================================================
 
     # Mass matrix
-    m = np.tile(dyn.structure.get_masses_array(), (3,1)).T.ravel()
+    m = dyn.structure.get_masses_3n_array()
     mm_mat = np.sqrt(np.outer(m, m))
 
     # Allocate frequencies array
@@ -681,7 +681,7 @@ def get_full_dynamic_bubble(tensor2, tensor3, k_grid, q,
 
 
     # dynamical matrix in q
-    m = np.tile(structure.get_masses_array(), (3,1)).T.ravel()
+    m = structure.get_masses_3n_array()
     mm_mat = np.sqrt(np.outer(m, m))
     mm_inv_mat = 1 / mm_mat
     #
@@ -928,7 +928,7 @@ def get_full_dynamic_correction_along_path(dyn,
         print(" ")
 
 
-    if ( tensor2 == None ):
+    if ( tensor2 is None ):
 
         # Prepare the tensor2
         tensor2 = CC.ForceTensor.Tensor2(dyn.structure, dyn.structure.generate_supercell(dyn.GetSupercell()), dyn.GetSupercell())
@@ -936,13 +936,13 @@ def get_full_dynamic_correction_along_path(dyn,
         tensor2.Center()
 
     # Scale the FC3 ===========================================================================
-    if  d3_scale_factor != None :
+    if  d3_scale_factor is not None :
             print(" ")
             print("d3 scaling : d3 -> d3 x {:>7.3f}".format(d3_scale_factor))
             print(" ")
             tensor3.tensor=tensor3.tensor*d3_scale_factor
     #  ================================== q-PATH ===============================================
-    if  q_path_file == None:
+    if  q_path_file is None:
         q_path=np.array(q_path)
     else:
         print(" ")
@@ -970,7 +970,7 @@ def get_full_dynamic_correction_along_path(dyn,
     # energy   in input is in cm-1
     # smearing in input is in cm-1
     # converto to Ry
-    if sm1_id != None and sm0_id != None:
+    if sm1_id is not None and sm0_id is not None:
         for sm in np.linspace(sm0_id,sm1_id,nsm):
                 print("     sm_id= {:>6.2f} cm-1".format(sm))
     else:
@@ -1218,7 +1218,7 @@ def get_full_dynamic_correction_along_path_multiprocessing(dyn,
         print(" ")
 
 
-    if ( tensor2 == None ):
+    if ( tensor2 is None ):
 
         # Prepare the tensor2
         tensor2 = CC.ForceTensor.Tensor2(dyn.structure, dyn.structure.generate_supercell(dyn.GetSupercell()), dyn.GetSupercell())
@@ -1226,13 +1226,13 @@ def get_full_dynamic_correction_along_path_multiprocessing(dyn,
         tensor2.Center()
 
     # Scale the FC3 ===========================================================================
-    if  d3_scale_factor != None :
+    if  d3_scale_factor is not None :
             print(" ")
             print("d3 scaling : d3 -> d3 x {:>7.3f}".format(d3_scale_factor))
             print(" ")
             tensor3.tensor=tensor3.tensor*d3_scale_factor
     #  ================================== q-PATH ===============================================
-    if  q_path_file == None:
+    if  q_path_file is None:
         q_path=np.array(q_path)
     else:
         print(" ")
@@ -1260,7 +1260,7 @@ def get_full_dynamic_correction_along_path_multiprocessing(dyn,
     # energy   in input is in cm-1
     # smearing in input is in cm-1
     # converto to Ry
-    if sm1_id != None and sm0_id != None:
+    if sm1_id is not None and sm0_id is not None:
         for sm in np.linspace(sm0_id,sm1_id,nsm):
                 print("     sm_id= {:>6.2f} cm-1".format(sm))
     else:
@@ -1436,7 +1436,7 @@ def get_diag_dynamic_bubble(tensor2,
 
 
     # dynamical matrix in q
-    m = np.tile(structure.get_masses_array(), (3,1)).T.ravel()
+    m = structure.get_masses_3n_array()
     mm_mat = np.sqrt(np.outer(m, m))
     mm_inv_mat = 1 / mm_mat
     #
@@ -1706,14 +1706,14 @@ def get_diag_dynamic_correction_along_path(dyn, tensor3,
     print(" " )
 
 
-    if sm1_id != None and sm0_id != None:
+    if sm1_id is not None and sm0_id is not None:
         for sm in np.linspace(sm0_id,sm1_id,nsm):
                 print("     sm_id= {:>6.2f} cm-1".format(sm))
     else:
         sm1_id=de*2.0
         sm0_id=de*2.0
 
-    if ( tensor2 == None ):
+    if ( tensor2 is None ):
 
         # Prepare the tensor2
         tensor2 = CC.ForceTensor.Tensor2(dyn.structure, dyn.structure.generate_supercell(dyn.GetSupercell()), dyn.GetSupercell())
@@ -1724,13 +1724,13 @@ def get_diag_dynamic_correction_along_path(dyn, tensor3,
 
 
     # Scale the FC3 ===========================================================================
-    if  d3_scale_factor != None :
+    if  d3_scale_factor is not None :
             print(" ")
             print("d3 scaling : d3 -> d3 x {:>7.3f}".format(d3_scale_factor))
             print(" ")
             tensor3.tensor=tensor3.tensor*d3_scale_factor
     #  ================================== q-PATH ===============================================
-    if  q_path_file == None:
+    if  q_path_file is None:
         q_path=np.array(q_path)
     else:
         print(" ")
@@ -1781,7 +1781,7 @@ def get_diag_dynamic_correction_along_path(dyn, tensor3,
     #print(" Spectral function, in diagonal approximation, printed in "+filename_sp+"_[smear_id]_[smear].dat")
     print(" Spectral function, in diagonal approximation, printed in "+filename_sp+"_[smear].dat")
     print(" ")
-    if filename_z != None:
+    if filename_z is not None:
         print(" ")
         print(" Z function [PRB 97 214101 (A21)], printed in "+filename_z+"_[smear].dat")
         print(" ")
@@ -1897,7 +1897,7 @@ def get_diag_dynamic_correction_along_path(dyn, tensor3,
             # =======
             # z func
             # =======
-            if filename_z != None:
+            if filename_z is not None:
                 filename_new=filename_z+'_'+name+'.dat'
                 fmt="{:>10.6f}\t"+"\t{:>11.3f}"+"\t{:>11.7f}"*(n_mod)+"\n"
 
@@ -2400,14 +2400,14 @@ def get_diag_dynamic_correction_along_path_multiprocessing(dyn, tensor3,
     print(" " )
 
 
-    if sm1_id != None and sm0_id != None:
+    if sm1_id is not None and sm0_id is not None:
         for sm in np.linspace(sm0_id,sm1_id,nsm):
                 print("     sm_id= {:>6.2f} cm-1".format(sm))
     else:
         sm1_id=de*2.0
         sm0_id=de*2.0
 
-    if ( tensor2 == None ):
+    if ( tensor2 is None ):
 
         # Prepare the tensor2
         tensor2 = CC.ForceTensor.Tensor2(dyn.structure, dyn.structure.generate_supercell(dyn.GetSupercell()), dyn.GetSupercell())
@@ -2418,13 +2418,13 @@ def get_diag_dynamic_correction_along_path_multiprocessing(dyn, tensor3,
 
 
     # Scale the FC3 ===========================================================================
-    if  d3_scale_factor != None :
+    if  d3_scale_factor is not None :
             print(" ")
             print("d3 scaling : d3 -> d3 x {:>7.3f}".format(d3_scale_factor))
             print(" ")
             tensor3.tensor=tensor3.tensor*d3_scale_factor
     #  ================================== q-PATH ===============================================
-    if  q_path_file == None:
+    if  q_path_file is None:
         q_path=np.array(q_path)
     else:
         print(" ")
@@ -2471,7 +2471,7 @@ def get_diag_dynamic_correction_along_path_multiprocessing(dyn, tensor3,
     #print(" Spectral function, in diagonal approximation, printed in "+filename_sp+"_[smear_id]_[smear].dat")
     print(" Spectral function, in diagonal approximation, printed in "+filename_sp+"_[smear].dat")
     print(" ")
-    if filename_z != None:
+    if filename_z is not None:
         print(" ")
         print(" Z function [PRB 97 214101 (A21)], printed in "+filename_z+"_[smear].dat")
         print(" ")
@@ -2612,7 +2612,7 @@ def multiprocessing_work_diag_dynamic_correction_along_path(iq,q,tensor2,tensor3
             # =======
             # z func
             # =======
-            if filename_z != None:
+            if filename_z is not None:
                 filename_new=filename_z+'_'+name+'.dat'
                 fmt="{:>10.6f}\t"+"\t{:>11.3f}"+"\t{:>11.7f}"*(n_mod)+"\n"
 
@@ -2962,7 +2962,7 @@ def get_perturb_dynamic_selfnrg(tensor2, tensor3,
     phi2_q = tensor2.Interpolate(q, asr = False)
 
     # dynamical matrix in q
-    m = np.tile(structure.get_masses_array(), (3,1)).T.ravel()
+    m = structure.get_masses_3n_array()
     mm_mat = np.sqrt(np.outer(m, m))
     mm_inv_mat = 1 / mm_mat
     #
@@ -3171,7 +3171,7 @@ def get_perturb_dynamic_correction_along_path(dyn, tensor3,
     print(" ===========================================" )
     print(" " )
 
-    if ( tensor2 == None ):
+    if ( tensor2 is None ):
 
         # Prepare the tensor2
         tensor2 = CC.ForceTensor.Tensor2(dyn.structure, dyn.structure.generate_supercell(dyn.GetSupercell()), dyn.GetSupercell())
@@ -3179,13 +3179,13 @@ def get_perturb_dynamic_correction_along_path(dyn, tensor3,
         tensor2.Center()
 
     # Scale the FC3 ===========================================================================
-    if  d3_scale_factor != None :
+    if  d3_scale_factor is not None :
             print(" ")
             print("d3 scaling : d3 -> d3 x {:>7.3f}".format(d3_scale_factor))
             print(" ")
             tensor3.tensor=tensor3.tensor*d3_scale_factor
     #  ================================== q-PATH ===============================================
-    if  q_path_file == None:
+    if  q_path_file is None:
         q_path=np.array(q_path)
     else:
         print(" ")
@@ -3314,7 +3314,7 @@ def get_os_perturb_dynamic_selfnrg(tensor2, tensor3,
     phi2_q = tensor2.Interpolate(q, asr = False)
 
     # dynamical matrix in q
-    m = np.tile(structure.get_masses_array(), (3,1)).T.ravel()
+    m = structure.get_masses_3n_array()
     mm_mat = np.sqrt(np.outer(m, m))
     mm_inv_mat = 1 / mm_mat
     #
@@ -3530,7 +3530,7 @@ def get_os_perturb_dynamic_correction_along_path(dyn, tensor3,
     print(" ===========================================" )
     print(" " )
 
-    if ( tensor2 == None ):
+    if ( tensor2 is None ):
 
         # Prepare the tensor2
         tensor2 = CC.ForceTensor.Tensor2(dyn.structure, dyn.structure.generate_supercell(dyn.GetSupercell()), dyn.GetSupercell())
@@ -3538,13 +3538,13 @@ def get_os_perturb_dynamic_correction_along_path(dyn, tensor3,
         tensor2.Center()
 
     # Scale the FC3 ===========================================================================
-    if  d3_scale_factor != None :
+    if  d3_scale_factor is not None :
             print(" ")
             print("d3 scaling : d3 -> d3 x {:>7.3f}".format(d3_scale_factor))
             print(" ")
             tensor3.tensor=tensor3.tensor*d3_scale_factor
     #  ================================== q-PATH ===============================================
-    if  q_path_file == None:
+    if  q_path_file is None:
         q_path=np.array(q_path)
     else:
         print(" ")
@@ -3848,7 +3848,7 @@ def get_dielectric_function(dyn, k_grid, T, e0 ,e1, de, ie, ismear
     # Get the integration points
     k_points = CC.symmetries.GetQGrid(structure.unit_cell, k_grid)
     # dynamical matrix in q
-    m = np.tile(structure.get_masses_array(), (3,1)).T.ravel()
+    m = structure.get_masses_3n_array()
     mm_mat = np.sqrt(np.outer(m, m))
     mm_inv_mat = 1 / mm_mat
     # Get the phi2 in q
@@ -192,11 +192,22 @@ Error, to compute the volume the structure must have a unit cell initialized:
                 The array containing the mass for each atom of the system.
         """
         
-        masses = np.zeros( self.N_atoms)
-        for i in range(self.N_atoms):
-            masses[i] = self.masses[ self.atoms[i] ]
-        
-        return masses
+        return np.fromiter((self.masses[atm] for atm in self.atoms),
+                           dtype = np.float64, count = self.N_atoms)
+
+    def get_masses_3n_array(self):
+        """
+        As get_masses_array, but the mass of each atom is repeated three
+        times, so that the array matches the cartesian degrees of freedom
+        (the ordering of the dynamical matrix).
+
+        Results
+        -------
+            masses : ndarray (size 3*self.N_atoms)
+                The array containing the mass for each cartesian coordinate.
+        """
+
+        return np.repeat(self.get_masses_array(), 3)
 
     def get_ityp_from_species(self, species):
         """
@@ -590,7 +590,7 @@ class ThermalConductivity:
                 self.scattering_grid = np.array(scattering_grid).astype(int)
         else:
             self.scattering_grid = self.kpoint_grid.copy()
-        if(smearing_scale == None):
+        if(smearing_scale is None):
             smearing_scale = 1.0
         self.smearing_scale = smearing_scale
         self.unitcell = self.dyn.structure.unit_cell
@@ -2839,7 +2839,7 @@ class ThermalConductivity:
             gvel = np.zeros((self.nband, self.nband, 3), dtype = complex)
         else:
             gvel = np.zeros((self.nband, 3), dtype = complex)
-        m = np.tile(self.dyn.structure.get_masses_array(), (3,1)).T.ravel()
+        m = self.dyn.structure.get_masses_3n_array()
         mm_mat = np.sqrt(np.outer(m, m))
         mm_inv_mat = 1.0 / mm_mat
 
@@ -3191,7 +3191,7 @@ class ThermalConductivity:
 
 
         uc_positions = self.dyn.structure.coords.copy()
-        m = np.tile(self.dyn.structure.get_masses_array(), (3,1)).T.ravel()
+        m = self.dyn.structure.get_masses_3n_array()
         mm_mat = np.sqrt(np.outer(m, m))
         mm_inv_mat = 1.0 / mm_mat
         dynmat = np.zeros_like(self.force_constants[0], dtype = complex)
@@ -3446,7 +3446,7 @@ class ThermalConductivity:
         phi2_q = self.fc2.Interpolate(q, asr = False)
 
         # dynamical matrix in q
-        m = np.tile(structure.get_masses_array(), (3,1)).T.ravel()
+        m = structure.get_masses_3n_array()
         mm_mat = np.sqrt(np.outer(m, m))
         mm_inv_mat = 1 / mm_mat
         #
@@ -3562,7 +3562,7 @@ class ThermalConductivity:
         # Get the phi2 in q
         phi2_q = self.fc2.Interpolate(q, asr = False)
         # dynamical matrix in q
-        m = np.tile(structure.get_masses_array(), (3,1)).T.ravel()
+        m = structure.get_masses_3n_array()
         mm_mat = np.sqrt(np.outer(m, m))
         mm_inv_mat = 1 / mm_mat
         #
@@ -3683,7 +3683,7 @@ class ThermalConductivity:
         # Get the phi2 in q
         phi2_q = self.fc2.Interpolate(q, asr = False)
         # dynamical matrix in q
-        m = np.tile(structure.get_masses_array(), (3,1)).T.ravel()
+        m = structure.get_masses_3n_array()
         mm_mat = np.sqrt(np.outer(m, m))
         mm_inv_mat = 1 / mm_mat
         #
@@ -3801,7 +3801,7 @@ class ThermalConductivity:
         phi2_q = self.fc2.Interpolate(q, asr = False)
 
         # dynamical matrix in q
-        m = np.tile(structure.get_masses_array(), (3,1)).T.ravel()
+        m = structure.get_masses_3n_array()
         mm_mat = np.sqrt(np.outer(m, m))
         mm_inv_mat = 1 / mm_mat
         #
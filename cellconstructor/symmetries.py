@@ -2207,7 +2207,7 @@ def GetSupercellFromQlist(q_list, unit_cell):
 #         """
 
 #         # Get the vector of the displacement in the polarization
-#         m = np.tile(structure.get_masses_array(), (3,1)).T.ravel()
+#         m = structure.get_masses_3n_array()
 #         disp_v = np.einsum("im,i->mi", pol_vects, np.sqrt(m))
 
 #         n_dim, n_modes = np.shape(pol_vects)
@@ -2256,7 +2256,7 @@ def _GetSymmetriesOnModes(symmetries, structure, pol_vects):
         """
 
         # Get the vector of the displacement in the polarization
-        m = np.tile(structure.get_masses_array(), (3,1)).T.ravel()
+        m = structure.get_masses_3n_array()
         disp_v = np.einsum("im,i->mi", pol_vects, 1 / np.sqrt(m))
         underdisp_v = np.einsum("im,i->mi", pol_vects, np.sqrt(m))
 
@@ -2306,7 +2306,7 @@ def GetSymmetriesOnModes(symmetries, structure, pol_vects, irts = [], timer = No
         """
 
         # Get the vector of the displacement in the polarization
-        m = np.tile(structure.get_masses_array(), (3,1)).T.ravel()
+        m = structure.get_masses_3n_array()
         disp_v = np.einsum("im,i->mi", pol_vects, 1 / np.sqrt(m))
         underdisp_v = np.einsum("im,i->mi", pol_vects, np.sqrt(m))
 